@@ -0,0 +1,131 @@
+import asyncio
+import re
+import unittest
+from unittest import mock
+
+import test_server
+
+
+class ServerTestCase(unittest.IsolatedAsyncioTestCase):
+    """Serve handle_connection on an ephemeral port with the parser picked by use_httptools"""
+    use_httptools = False
+
+    async def asyncSetUp(self):
+        parser = test_server.httptools if self.use_httptools else None
+        patcher = mock.patch.object(test_server, 'httptools', parser)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = await asyncio.start_server(test_server.handle_connection, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def exchange(self, data):
+        """Send raw request bytes, return everything written back until the server closes"""
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        try:
+            writer.write(data)
+            return await asyncio.wait_for(reader.read(), 5)
+        finally:
+            writer.close()
+
+    def statuses(self, response):
+        return [int(code) for code in re.findall(rb'HTTP/1\.1 (\d{3}) ', response)]
+
+
+class RequestParsingTests:
+    """Behaviour both request readers share"""
+
+    async def test_pipelined_requests_share_connection(self):
+        response = await self.exchange(
+            b"GET / HTTP/1.1\r\nHost: x\r\n\r\n"
+            b"GET /about HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n"
+        )
+        self.assertEqual(self.statuses(response), [200, 200])
+        self.assertIn(b"About Our Service", response)
+
+    async def test_post_echoes_body(self):
+        response = await self.exchange(
+            b"POST / HTTP/1.1\r\nHost: x\r\nContent-Length: 5\r\nConnection: close\r\n\r\nhello"
+        )
+        self.assertEqual(self.statuses(response), [200])
+        self.assertTrue(response.endswith(b"Received POST data: hello"))
+
+    async def test_expect_continue(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.addCleanup(writer.close)
+        writer.write(
+            b"POST / HTTP/1.1\r\nHost: x\r\nContent-Length: 5\r\n"
+            b"Expect: 100-continue\r\nConnection: close\r\n\r\n"
+        )
+        # The body is only sent once the interim response arrives
+        interim = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 1)
+        self.assertEqual(interim, b"HTTP/1.1 100 Continue\r\n\r\n")
+        writer.write(b"hello")
+        response = await asyncio.wait_for(reader.read(), 5)
+        self.assertEqual(self.statuses(response), [200])
+        self.assertTrue(response.endswith(b"Received POST data: hello"))
+
+    async def test_oversized_headers(self):
+        response = await self.exchange(
+            b"GET / HTTP/1.1\r\nHost: x\r\nX-Pad: " + b"a" * 70000 + b"\r\n"
+        )
+        self.assertEqual(self.statuses(response), [431])
+
+    async def test_timeout_covers_whole_request(self):
+        # A client trickling bytes faster than the timeout is still dropped once it expires
+        patcher = mock.patch.object(test_server.RequestHandler, 'keepalive_timeout', 0.5)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.addCleanup(writer.close)
+
+        async def trickle():
+            try:
+                for byte in b"GET / HTTP/1.1\r\nHost: x\r\n":
+                    writer.write(bytes([byte]))
+                    await asyncio.sleep(0.1)
+            except ConnectionError:
+                pass
+
+        trickler = asyncio.create_task(trickle())
+        self.addCleanup(trickler.cancel)
+        start = asyncio.get_running_loop().time()
+        self.assertEqual(await asyncio.wait_for(reader.read(), 5), b"")
+        self.assertLess(asyncio.get_running_loop().time() - start, 1.5)
+
+    async def test_bad_request_line(self):
+        response = await self.exchange(b"NOT A REQUEST\r\n\r\n")
+        self.assertEqual(self.statuses(response), [400])
+
+
+class StreamRequestReaderTests(RequestParsingTests, ServerTestCase):
+
+    async def test_transfer_encoding_closes_connection(self):
+        # The chunked body must not be read as a second request
+        response = await self.exchange(
+            b"POST / HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"GET /about HTTP/1.1\r\nHost: x\r\n\r\n"
+        )
+        self.assertEqual(self.statuses(response), [501])
+        self.assertIn(b"Connection: close\r\n", response)
+
+
+@unittest.skipIf(test_server.httptools is None, "httptools is not installed")
+class HttptoolsRequestReaderTests(RequestParsingTests, ServerTestCase):
+    use_httptools = True
+
+    async def test_chunked_body_is_decoded(self):
+        response = await self.exchange(
+            b"POST / HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"5\r\nhello\r\n0\r\n\r\n"
+            b"GET /about HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n"
+        )
+        self.assertEqual(self.statuses(response), [200, 200])
+        self.assertIn(b"Received POST data: hello", response)
+
+
+if __name__ == '__main__':
+    unittest.main()
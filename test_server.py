@@ -1,101 +1,94 @@
-# test_server.py
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import json
+import argparse
+import contextlib
+import errno
+import functools
 import logging
+import os
+import random
+import signal
 import sys
 import socket
-import threading
 import asyncio
 import time
-import random
-import urllib.parse
-from socketserver import ThreadingMixIn
-from concurrent.futures import ThreadPoolExecutor, Future
-from queue import Queue, Empty
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    stream=sys.stdout
-)
-logger = logging.getLogger(__name__)
+import uuid
+from collections import deque, namedtuple
+from http import HTTPStatus
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
+from queue import SimpleQueue
 
-class RequestHandler(BaseHTTPRequestHandler):
-    protocol_version = 'HTTP/1.1'
-    
-    # Create a thread pool for handling long-running requests
-    executor = ThreadPoolExecutor(max_workers=10)
-    response_queues = {}
-    response_lock = threading.Lock()
+try:
+    import numpy as np
+except ImportError:  # optional: fall back to random.randrange digits
+    np = None
 
-    def setup(self):
-        super().setup()
-        self.request.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-        if hasattr(socket, 'TCP_KEEPIDLE'):
-            self.request.setsockopt(socket.SOL_TCP, socket.TCP_KEEPIDLE, 60)
-        if hasattr(socket, 'TCP_KEEPINTVL'):
-            self.request.setsockopt(socket.SOL_TCP, socket.TCP_KEEPINTVL, 60)
-        if hasattr(socket, 'TCP_KEEPCNT'):
-            self.request.setsockopt(socket.SOL_TCP, socket.TCP_KEEPCNT, 5)
+try:
+    import httptools
+except ImportError:  # optional: fall back to parsing with StreamReader.readuntil
+    httptools = None
 
-    def generate_random_rows(self):
-        rows = []
-        for i in range(10):
-            # Generate a row with 8 random digits
-            row = ''.join([str(random.randint(0, 9)) for _ in range(8)])
-            rows.append(f"Row {i+1}: {row}")
-        return "\n".join(rows)
-
-    def process_long_request(self, request_id):
-        """Handle long-running request processing in a separate thread"""
-        try:
-            logger.info(f"[{request_id}] Processing request...")
-            
-            # Check if client is still connected before each update
-            if not self.is_client_connected(request_id):
-                logger.info(f"[{request_id}] Client disconnected, stopping processing")
-                return
+try:
+    import uvloop
+except ImportError:  # optional: fall back to the stdlib event loop
+    uvloop = None
 
-            time.sleep(10)
-            logger.info(f"[{request_id}] Stage 1 complete...")
-            
-            if not self.is_client_connected(request_id):
-                logger.info(f"[{request_id}] Client disconnected, stopping processing")
-                return
+logger = logging.getLogger(__name__)
 
-            logger.info(f"[{request_id}] Stage 2 complete...")
-            logger.info(f"[{request_id}] Stage 3 complete...")
-            response = self.generate_random_rows()
-            
-            # Only send response if client is still connected
-            if self.is_client_connected(request_id):
-                with self.response_lock:
-                    if request_id in self.response_queues:
-                        self.response_queues[request_id].put(("final", response))
-        except Exception as e:
-            logger.error(f"[{request_id}] Error in long request: {e}")
-            if self.is_client_connected(request_id):
-                with self.response_lock:
-                    if request_id in self.response_queues:
-                        self.response_queues[request_id].put(("error", f"Error: {e}"))
-        finally:
-            # Clean up resources
-            self.cleanup_request(request_id)
+class _BatchingMemoryHandler(MemoryHandler):
+    """MemoryHandler that also flushes whenever log_queue has drained, so
+    records are batched under load but never left sitting in the buffer.
+    The target is a StreamHandler, each batch goes out in one write and one flush"""
 
-    def is_client_connected(self, request_id):
-        """Check if client is still connected"""
-        with self.response_lock:
-            return request_id in self.response_queues
+    def __init__(self, log_queue, capacity, flushLevel, target):
+        super().__init__(capacity, flushLevel=flushLevel, target=target)
+        self.log_queue = log_queue
 
-    def cleanup_request(self, request_id):
-        """Clean up resources for a request"""
-        with self.response_lock:
-            if request_id in self.response_queues:
-                del self.response_queues[request_id]
-                logger.info(f"[{request_id}] Cleaned up resources")
+    def shouldFlush(self, record):
+        return super().shouldFlush(record) or self.log_queue.empty()
+
+    def flush(self):
+        # StreamHandler.emit writes and flushes every record, so format the
+        # whole buffer here and hand the stream a single string instead
+        with self.lock:
+            if not self.buffer or self.target is None:
+                return
+            target = self.target
+            try:
+                lines = [target.format(record) + target.terminator for record in self.buffer]
+                with target.lock:
+                    target.stream.write(''.join(lines))
+                    target.flush()
+            except Exception:
+                target.handleError(self.buffer[0])
+            finally:
+                self.buffer.clear()
+
+@contextlib.contextmanager
+def queued_logging():
+    """Route root logging through a queue while the block runs. Request handlers
+    only enqueue records, a listener thread formats them and writes them to
+    stdout in batches. Entered once per process, the thread would not survive a fork"""
+    log_queue = SimpleQueue()
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    batching_handler = _BatchingMemoryHandler(
+        log_queue, capacity=256, flushLevel=logging.ERROR, target=stdout_handler
+    )
+    listener = QueueListener(log_queue, batching_handler)
+    queue_handler = QueueHandler(log_queue)
+    logging.root.addHandler(queue_handler)
+    previous_level = logging.root.level
+    logging.root.setLevel(logging.INFO)
+    listener.start()
+    try:
+        yield
+    finally:
+        listener.stop()
+        # Records handled after the stop sentinel was queued are still buffered
+        batching_handler.flush()
+        logging.root.removeHandler(queue_handler)
+        logging.root.setLevel(previous_level)
 
-    def serve_about_page(self):
-        html_content = """
+_ABOUT_HTML = """
         <!DOCTYPE html>
         <html lang="en">
         <head>
@@ -166,131 +159,616 @@ class RequestHandler(BaseHTTPRequestHandler):
             </script>
         </body>
         </html>
-        """
+"""
+
+_ROW_PREFIXES = [f"Row {i+1}: ".encode() for i in range(10)]
+
+# Prebuilt header blocks leave out the blank line, write_chunks picks the ending
+# depending on whether the connection stays open
+_END_HEADERS = b"\r\n"
+_END_HEADERS_CLOSE = b"Connection: close\r\n\r\n"
+# Interim response to an HTTP/1.1 client holding its body back behind Expect: 100-continue
+_CONTINUE = b"HTTP/1.1 100 Continue\r\n\r\n"
+
+# The / body is a constant prefix plus ten rows of fixed length, so its
+# Content-Length and header block never change either
+_HELLO_PREFIX = b"Hello from test server!"
+_ROWS_LENGTH = sum(len(prefix) + 8 for prefix in _ROW_PREFIXES) + len(_ROW_PREFIXES) - 1
+_HELLO_HEADERS = (
+    "HTTP/1.1 200 OK\r\n"
+    "Content-Type: text/plain\r\n"
+    f"Content-Length: {len(_HELLO_PREFIX) + _ROWS_LENGTH}\r\n"
+).encode('ascii')
+
+_POST_PREFIX = b"Received POST data: "
+
+_REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+
+# The about page never changes, so encode it and build its header block once
+_ABOUT_BODY = _ABOUT_HTML.encode('utf-8')
+_ABOUT_HEADERS = (
+    "HTTP/1.1 200 OK\r\n"
+    "Content-Type: text/html; charset=utf-8\r\n"
+    f"Content-Length: {len(_ABOUT_BODY)}\r\n"
+    "Cache-Control: no-cache, no-store, must-revalidate\r\n"
+    "Pragma: no-cache\r\n"
+    "Expires: 0\r\n"
+).encode('ascii')
+
+ParsedRequest = namedtuple(
+    'ParsedRequest', 'command path request_version headers body keep_alive'
+)
+
+class StreamRequestReader:
+    """Read requests with StreamReader.readuntil and a pure-Python header parser"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def read_request(self, timeout):
+        """Return the next ParsedRequest, None on EOF, raise ValueError if malformed
+        and NotImplementedError for a Transfer-Encoding body"""
         try:
-            # Convert content to bytes once
-            content_bytes = html_content.encode('utf-8')
-            content_length = len(content_bytes)
-
-            # Send headers
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/html; charset=utf-8')
-            self.send_header('Content-Length', str(content_length))
-            self.send_header('Connection', 'close')
-            self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-            self.send_header('Pragma', 'no-cache')
-            self.send_header('Expires', '0')
-            self.end_headers()
-
-            # Send content in one go
-            self.wfile.write(content_bytes)
-            self.wfile.flush()
-
-            # Force connection close
+            head = await asyncio.wait_for(self.reader.readuntil(b'\r\n\r\n'), timeout)
+        except asyncio.IncompleteReadError:
+            return None
+
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        words = request_line.split()
+        if len(words) != 3 or not words[2].startswith('HTTP/'):
+            raise ValueError(f"Bad request line {request_line!r}")
+        command, path, request_version = words
+
+        headers = {}
+        for line in header_lines:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+        if 'transfer-encoding' in headers:
+            # Only Content-Length bodies are framed here, reading on past a chunked
+            # body would parse it as the next request on the connection
+            raise NotImplementedError(f"Transfer-Encoding {headers['transfer-encoding']!r}")
+        content_length = headers.get('content-length', '0')
+        if not content_length.isdigit():
+            raise ValueError(f"Bad Content-Length {content_length!r}")
+        if request_version != 'HTTP/1.0' and headers.get('expect', '').lower() == '100-continue':
+            self.writer.write(_CONTINUE)
+        # A client that stalls mid-body is dropped like an idle one
+        body = await asyncio.wait_for(self.reader.readexactly(int(content_length)), timeout)
+
+        connection = headers.get('connection', '').lower()
+        if request_version == 'HTTP/1.0':
+            keep_alive = connection == 'keep-alive'
+        else:
+            keep_alive = connection != 'close'
+        return ParsedRequest(command, path, request_version, headers, body, keep_alive)
+
+class HttptoolsRequestReader:
+    """Read requests by feeding stream chunks to the C httptools parser"""
+    # Same bound as the StreamReader limit readuntil enforces in the fallback
+    max_header_bytes = 2 ** 16
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.parser = httptools.HttpRequestParser(self)
+        self.requests = deque()
+        self.error = None
+        # Set between the headers and the body of a request sent with Expect: 100-continue
+        self.expect_continue = False
+        # Bytes fed since the last request's headers completed, checked against max_header_bytes
+        self.header_bytes = 0
+        self.in_body = False
+
+    # httptools parser callbacks
+
+    def on_message_begin(self):
+        self.url = b''
+        self.headers = {}
+        self.body = []
+
+    def on_url(self, url):
+        self.url += url
+
+    def on_header(self, name, value):
+        self.headers[name.decode('latin-1').lower()] = value.decode('latin-1')
+
+    def on_headers_complete(self):
+        self.header_bytes = 0
+        self.in_body = True
+        self.expect_continue = (
+            self.parser.get_http_version() != '1.0'
+            and self.headers.get('expect', '').lower() == '100-continue'
+        )
+
+    def on_body(self, body):
+        self.body.append(body)
+
+    def on_message_complete(self):
+        self.in_body = False
+        self.expect_continue = False
+        self.requests.append(ParsedRequest(
+            self.parser.get_method().decode('ascii'),
+            self.url.decode('latin-1'),
+            f"HTTP/{self.parser.get_http_version()}",
+            self.headers,
+            b''.join(self.body),
+            self.parser.should_keep_alive(),
+        ))
+
+    async def read_request(self, timeout):
+        """Return the next ParsedRequest, None on EOF, raise ValueError if malformed
+        and LimitOverrunError once the headers outgrow max_header_bytes.
+        The timeout covers the whole request, not each read"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self.requests:
+            if self.error is not None:
+                raise self.error
+            if self.expect_continue:
+                # Every earlier response is written by now, the client waits for this one
+                self.writer.write(_CONTINUE)
+                self.expect_continue = False
+            data = await asyncio.wait_for(self.reader.read(65536), deadline - loop.time())
+            if not data:
+                return None
+            if not self.in_body:
+                self.header_bytes += len(data)
             try:
-                self.close_connection = True
-                self.connection.shutdown(socket.SHUT_WR)
-            except Exception as e:
-                logger.debug(f"Connection already closed: {e}")
+                self.parser.feed_data(data)
+            except httptools.HttpParserError as e:
+                # Requests completed earlier in this chunk are still served first
+                self.error = ValueError(str(e))
+            else:
+                if self.header_bytes > self.max_header_bytes:
+                    self.error = asyncio.LimitOverrunError(
+                        "Request headers exceed max_header_bytes", self.header_bytes
+                    )
+        return self.requests.popleft()
+
+class RequestHandler:
+    """Serve HTTP/1.1 requests over a single asyncio stream connection"""
+    protocol_version = 'HTTP/1.1'
+    # Seconds an idle keep-alive connection may wait for its next request
+    keepalive_timeout = 5.0
+    
+    # Response futures of long-running requests, only touched from the event loop
+    response_states = {}
+    # Strong references to running long-request tasks so they are not collected
+    long_request_tasks = set()
+    # Fixed window of in-flight long requests, ids in admission order. Slots are
+    # reclaimed oldest first, once the oldest is still running new ones get a 503
+    long_request_slots = deque()
+    max_long_requests = 1024
+    # Seconds a /long client waits for its result before it gets a 500
+    long_request_timeout = 30.0
+    # Seconds between checks for a /long client that has disconnected
+    disconnect_poll_interval = 0.5
 
-            logger.info("About page served successfully")
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.client_address = writer.get_extra_info('peername')
+        self.server_address = writer.get_extra_info('sockname')
+        self.close_connection = False
+        self.headers_sent = False
+        if httptools is not None:
+            self.request_reader = HttptoolsRequestReader(reader, writer)
+        else:
+            self.request_reader = StreamRequestReader(reader, writer)
+
+    def setup(self):
+        sock = self.writer.get_extra_info('socket')
+        # Each response leaves in one writelines, so there is never a partial
+        # segment worth holding back for Nagle
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            sock.setsockopt(socket.SOL_TCP, socket.TCP_KEEPIDLE, 60)
+        if hasattr(socket, 'TCP_KEEPINTVL'):
+            sock.setsockopt(socket.SOL_TCP, socket.TCP_KEEPINTVL, 60)
+        if hasattr(socket, 'TCP_KEEPCNT'):
+            sock.setsockopt(socket.SOL_TCP, socket.TCP_KEEPCNT, 5)
+
+    async def handle(self):
+        """Serve requests until the client or a handler closes the connection"""
+        self.setup()
+        try:
+            while not self.close_connection:
+                await self.handle_one_request()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def handle_one_request(self):
+        try:
+            request = await self.request_reader.read_request(self.keepalive_timeout)
+        except asyncio.TimeoutError:
+            # Client stayed idle past the keep-alive timeout
+            request = None
+        except asyncio.LimitOverrunError:
+            await self.send_error(431)
+            return
+        except ValueError:
+            await self.send_error(400, "Bad request syntax")
+            return
+        except NotImplementedError as e:
+            await self.send_error(501, f"Unsupported {e}")
+            return
+
+        if request is None:
+            self.close_connection = True
+            return
+        self.command, self.path, self.request_version, self.headers, self.body, keep_alive = request
+        if not keep_alive:
+            self.close_connection = True
+
+        method = getattr(self, 'do_' + self.command, None)
+        if method is None:
+            await self.send_error(501, f"Unsupported method ({self.command!r})")
+            return
+        await method()
+
+    async def send_simple_response(self, code, content_type, body, close=False, extra_headers=None):
+        """Send status line, headers and body with a single writelines + drain"""
+        extra = ''.join(f"{k}: {v}\r\n" for k, v in extra_headers.items()) if extra_headers else ""
+        header = (
+            f"{self.protocol_version} {code} {HTTPStatus(code).phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"{extra}"
+        ).encode('latin-1')
+        if close:
+            self.close_connection = True
+        await self.write_chunks(header, [body])
+
+    async def write_chunks(self, header, body_chunks):
+        """Send a header block without its blank line plus the body with one writelines + drain.
+        Connection: close is added whenever the connection is closed after this response"""
+        end = _END_HEADERS_CLOSE if self.close_connection else _END_HEADERS
+        self.writer.writelines([header, end, *body_chunks])
+        self.headers_sent = True
+        await self.writer.drain()
+
+    async def send_error(self, code, message=None, extra_headers=None):
+        if message is None:
+            message = HTTPStatus(code).phrase
+        body = f"Error {code}: {message}".encode('utf-8')
+        await self.send_simple_response(
+            code, 'text/plain; charset=utf-8', body, close=True, extra_headers=extra_headers
+        )
+
+    def generate_random_rows(self):
+        if np is not None:
+            # One vectorized draw for all 10 rows of 8 digits, shifted into ASCII '0'-'9'
+            digits = (np.random.randint(0, 10, (10, 8), dtype=np.uint8) + 0x30).tobytes()
+        else:
+            # One uniform draw below 10**80, zero-padded to exactly 80 ASCII digits
+            digits = b'%080d' % random.randrange(10**80)
+        return b"\n".join(_ROW_PREFIXES[i] + digits[i*8:(i+1)*8] for i in range(10))
+
+    async def start_long_request(self, request_id):
+        """Schedule process_long_request and return the future it resolves,
+        or answer 503 and return None when every slot is in use.
+        A request_id that is already running gets its existing future back"""
+        future, created = self.register_request(request_id)
+        if future is None:
+            logger.warning("[%s] All %s long request slots busy", request_id, self.max_long_requests)
+            await self.send_error(
+                503, "Too many long-running requests", extra_headers={'Retry-After': 10}
+            )
+            return None
+        if created:
+            task = asyncio.create_task(self.process_long_request(request_id))
+            self.long_request_tasks.add(task)
+            task.add_done_callback(self.long_request_tasks.discard)
+            future.add_done_callback(functools.partial(self.stop_long_request, task, request_id))
+        return future
+
+    def stop_long_request(self, task, request_id, future):
+        """Future done callback. A cancelled future means the consumer gave up, so stop
+        the producer and free the slot now rather than when its work would finish"""
+        if future.cancelled():
+            task.cancel()
+            self.cleanup_request(request_id)
+
+    async def process_long_request(self, request_id):
+        """Handle long-running request processing as a task on the event loop"""
+        try:
+            logger.info("[%s] Processing request...", request_id)
+
+            # stop_long_request cancels this task when the client disconnects or times out
+            await asyncio.sleep(10)
+            logger.info("[%s] Stage 1 complete...", request_id)
+            logger.info("[%s] Stage 2 complete...", request_id)
+            logger.info("[%s] Stage 3 complete...", request_id)
+            response = self.generate_random_rows()
+            
+            # Only send response if client is still connected
+            self.deliver_response(request_id, ("final", response))
+        except asyncio.CancelledError:
+            logger.info("[%s] Request cancelled, stopping processing", request_id)
+            raise
+        except Exception as e:
+            logger.error("[%s] Error in long request: %s", request_id, e)
+            self.deliver_response(request_id, ("error", f"Error: {e}"))
+        finally:
+            # Clean up resources
+            self.cleanup_request(request_id)
+
+    def deliver_response(self, request_id, result):
+        """Hand result to the waiting consumer, a no-op once it has gone away"""
+        future = self.response_states.get(request_id)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    async def wait_for_response(self, request_id, future, timeout):
+        """Consumer side of a long request, returns its ("final" | "error", payload) result,
+        or None once the client has disconnected. Giving up on the result, on timeout or
+        disconnect, cancels the future and with it process_long_request"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not future.done():
+            # StreamReader has no disconnect event to wait on, so check for EOF between waits
+            if self.reader.at_eof() or self.reader.exception() is not None:
+                logger.info("[%s] Client disconnected", request_id)
+                future.cancel()
+                return None
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.info("[%s] No response after %s seconds", request_id, timeout)
+                future.cancel()
+                return ("error", f"Error: timed out after {timeout} seconds")
+            await asyncio.wait([future], timeout=min(remaining, self.disconnect_poll_interval))
+        return future.result()
+
+    def register_request(self, request_id):
+        """Return (future, created): a new response future for the request, or
+        the existing one with created False. The future is None when no slot is free"""
+        future = self.response_states.get(request_id)
+        if future is not None:
+            return future, False
+
+        slots = self.long_request_slots
+        while slots and slots[0] not in self.response_states:
+            slots.popleft()
+        if len(slots) >= self.max_long_requests:
+            return None, False
+
+        future = asyncio.get_running_loop().create_future()
+        self.response_states[request_id] = future
+        slots.append(request_id)
+        return future, True
+
+    def cleanup_request(self, request_id):
+        """Clean up resources for a request"""
+        if self.response_states.pop(request_id, None) is not None:
+            logger.info("[%s] Cleaned up resources", request_id)
+
+    async def serve_about_page(self):
+        try:
+            # Headers and body are prebuilt at import
+            await self.write_chunks(_ABOUT_HEADERS, [_ABOUT_BODY])
+
+            logger.debug("About page served successfully")
         except Exception as e:
-            logger.error(f"Error serving about page: {e}")
+            logger.error("Error serving about page: %s", e)
             # Try to send error response if headers haven't been sent
             if not self.headers_sent:
-                self.send_error(500, f"Internal error: {str(e)}")
+                await self.send_error(500, f"Internal error: {str(e)}")
             raise
 
-    def do_GET(self):
-        client_ip = self.client_address[0]
-        logger.info(f"Received GET request from {client_ip} for path: {self.path}")
-        logger.info(f"Server address: {self.server.server_address}")
-        logger.info(f"Headers: {self.headers}")
-        
-        if self.path == '/about':
-            self.serve_about_page()
-            logger.info(f"Served about page to {client_ip}")
+    async def serve_default(self):
+        # Prefix and headers are prebuilt, only the random rows change per request
+        await self.write_chunks(_HELLO_HEADERS, [_HELLO_PREFIX, self.generate_random_rows()])
+
+    async def serve_long_request(self):
+        # Runs process_long_request and answers with its result, start_long_request
+        # has already sent the 503 when it returns None
+        request_id = uuid.uuid4().hex[:8]
+        future = await self.start_long_request(request_id)
+        if future is None:
+            return
+        result = await self.wait_for_response(request_id, future, self.long_request_timeout)
+        if result is None:
+            # Nobody is left to answer
+            self.close_connection = True
             return
+        kind, payload = result
+        if kind == "final":
+            await self.send_simple_response(200, 'text/plain', payload)
+        else:
+            await self.send_simple_response(500, 'text/plain; charset=utf-8', payload.encode('utf-8'))
 
-        response = "Hello from test server!" + self.generate_random_rows()
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
-        self.wfile.write(response.encode('utf-8'))
-        logger.info(f"Response sent to {client_ip}")
+    _GET_ROUTES = {
+        '/about': serve_about_page,
+        '/long': serve_long_request,
+        '/': serve_default,
+    }
 
-    def do_POST(self):
-        logger.info(f"Received POST request from {self.client_address}")
-        logger.info(f"Headers: {self.headers}")
+    async def do_GET(self):
+        client_ip = self.client_address[0]
+        logger.info("Received GET request from %s for path: %s", client_ip, self.path)
+        logger.debug("Server address: %s", self.server_address)
+        logger.debug("Headers: %s", self.headers)
+        
+        # Route on the path alone, any query string is ignored. Unknown paths
+        # get the default page like before
+        handler = self._GET_ROUTES.get(self.path.partition('?')[0], RequestHandler.serve_default)
+        await handler(self)
+        logger.debug("Response sent to %s", client_ip)
+
+    async def do_POST(self):
+        logger.info("Received POST request from %s", self.client_address)
+        logger.debug("Headers: %s", self.headers)
         
         try:
-            content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length)
-            logger.info(f"Received POST data: {post_data.decode('utf-8')}")
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
-            self.send_header('Connection', 'close')
-            self.end_headers()
+            # The body is echoed as bytes, it is only decoded when debug logging wants it
+            if logger.isEnabledFor(logging.DEBUG):
+                text = self.body.decode('utf-8', 'replace')
+                logger.debug("Received POST data: %s", text)
+                logger.debug("Sending response: Received POST data: %s", text)
             
-            response = f"Received POST data: {post_data.decode('utf-8')}"
-            logger.info(f"Sending response: {response}")
-            self.wfile.write(response.encode('utf-8'))
-            self.wfile.flush()
-            logger.info("POST response sent successfully")
-            sys.stdout.flush()
+            await self.send_simple_response(200, 'text/plain', _POST_PREFIX + self.body)
+            logger.debug("POST response sent successfully")
+        except ConnectionError:
+            raise
         except Exception as e:
-            logger.error(f"Error handling POST request: {e}")
-            self.send_error(500, f"Internal error: {str(e)}")
+            logger.error("Error handling POST request: %s", e)
+            await self.send_error(500, f"Internal error: {str(e)}")
+
+async def handle_connection(reader, writer):
+    """asyncio.start_server callback, one coroutine per client connection"""
+    try:
+        await RequestHandler(reader, writer).handle()
+    except asyncio.CancelledError:
+        # Shutdown cancels open keep-alive connections. Ending quietly here keeps
+        # start_server's done callback from logging the cancellation as an error
+        pass
+
+@functools.lru_cache(maxsize=None)
+def resolve_ip_address(host):
+    """Get the actual IP address, skipping DNS when host is already numeric"""
+    if host not in ('', '0.0.0.0', '::'):
+        try:
+            socket.getaddrinfo(host, None, flags=socket.AI_NUMERICHOST)
+            return host
+        except socket.gaierror:
+            pass
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return '127.0.0.1'
+
+async def serve(server_address, reuse_port=False):
+    # With reuse_port every worker process binds its own listener and the
+    # kernel spreads incoming connections across them. It also lets a second
+    # launch co-bind next to a running one, so it is only set for multi-worker runs
+    server = await asyncio.start_server(
+        handle_connection, *server_address, backlog=4096, reuse_port=reuse_port
+    )
+    listen_socket = server.sockets[0]
 
-# Add new ThreadedHTTPServer class
-class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
-    """Handle requests in a separate thread."""
-    daemon_threads = True
+    hostname = socket.gethostname()
+    ip_address = resolve_ip_address(server_address[0])
 
-# Update the run_server function
-def run_server():
+    logger.info("Server socket created with options:")
+    logger.info("Hostname: %s", hostname)
+    logger.info("IP Address: %s", ip_address)
+    logger.info("Listening Address: %s", listen_socket.getsockname())
+    logger.info("Socket family: %s", listen_socket.family)
+    logger.info("Socket type: %s", listen_socket.type)
+    logger.info("Event loop: %s", type(asyncio.get_running_loop()).__module__)
+    logger.info("Worker pid: %s", os.getpid())
+
+    logger.info("Server running on http://%s:8000", ip_address)
+    # SIGTERM shuts the server down like Ctrl-C does, run_workers stops its children with it
+    with contextlib.suppress(NotImplementedError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    async with server:
+        try:
+            await server.serve_forever()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Server error: %s", e)
+
+def run_server(reuse_port=False):
     server_address = ('127.0.0.1', 8000)
     retries = 3
+    # uvloop (libuv) when installed, otherwise the stdlib selector loop
+    run = uvloop.run if uvloop is not None else asyncio.run
     
-    for attempt in range(retries):
-        try:
-            httpd = ThreadedHTTPServer(server_address, RequestHandler)
-            httpd.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            
-            # Get the actual IP address
-            hostname = socket.gethostname()
-            ip_address = socket.gethostbyname(hostname)
-            
-            logger.info(f"Server socket created with options:")
-            logger.info(f"Hostname: {hostname}")
-            logger.info(f"IP Address: {ip_address}")
-            logger.info(f"Listening Address: {httpd.server_address}")
-            logger.info(f"Socket family: {httpd.socket.family}")
-            logger.info(f"Socket type: {httpd.socket.type}")
-            
-            logger.info(f"Server running on http://{ip_address}:8000")
+    # Ctrl-C or SIGTERM also ends the wait between bind retries
+    try:
+        for attempt in range(retries):
             try:
-                httpd.serve_forever()
-            except KeyboardInterrupt:
-                logger.info("Shutting down the server...")
-                httpd.server_close()
+                run(serve(server_address, reuse_port))
                 break
-            except Exception as e:
-                logger.error(f"Server error: {e}")
-                httpd.server_close()
-                break
-        except OSError as e:
-            if e.errno == 48:  # Address already in use
-                if attempt < retries - 1:
-                    logger.warning(f"Port 8000 is in use, waiting 5 seconds before retry {attempt + 1}/{retries}")
-                    time.sleep(5)
-                    continue
+            except OSError as e:
+                if e.errno == errno.EADDRINUSE:
+                    if attempt < retries - 1:
+                        logger.warning("Port 8000 is in use, waiting 5 seconds before retry %s/%s", attempt + 1, retries)
+                        time.sleep(5)
+                        continue
+                    else:
+                        logger.error("Could not bind to port 8000 after multiple attempts")
+                        raise
                 else:
-                    logger.error("Could not bind to port 8000 after multiple attempts")
                     raise
-            else:
-                raise
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        logger.info("Shutting down the server...")
+
+def _terminate(signum, frame):
+    """SIGTERM handler for startup and retry sleeps, before serve installs its loop
+    handler. It stops run_server the same way Ctrl-C does"""
+    raise KeyboardInterrupt
+
+def run_workers(workers=1):
+    """Fork workers - 1 children that each run their own server, then serve in the parent too.
+    With more than one worker every process binds port 8000 with SO_REUSEPORT"""
+    if not _REUSE_PORT or not hasattr(os, 'fork'):
+        workers = 1
+    reuse_port = workers > 1
+    # Inherited by the children, so a SIGTERM before their loop runs still shuts down cleanly
+    signal.signal(signal.SIGTERM, _terminate)
+
+    children = []
+    for _ in range(workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                # The parent owns shutdown: the terminal's Ctrl-C is handled there,
+                # and it stops each child with a single SIGTERM
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                with queued_logging():
+                    try:
+                        run_server(reuse_port)
+                        status = 0
+                    except Exception:
+                        logger.exception("Worker %s failed", os.getpid())
+                    finally:
+                        # Nothing may interrupt the log flush on the way out
+                        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            finally:
+                # os._exit skips interpreter cleanup, flush buffered log output first
+                logging.shutdown()
+                os._exit(status)
+        children.append(pid)
+
+    with queued_logging():
+        try:
+            run_server(reuse_port)
+        finally:
+            # Already on the way out, a second SIGTERM must not cut the children's shutdown short
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                    _, status = os.waitpid(pid, 0)
+                except (ChildProcessError, ProcessLookupError):
+                    continue
+                if status != 0:
+                    logger.error("Worker %s exited with status %s", pid, os.waitstatus_to_exitcode(status))
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
 
 if __name__ == '__main__':
-    run_server() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Test server for the tunnel agent")
+    parser.add_argument(
+        '--workers', type=_positive_int, default=1,
+        help="number of server processes sharing port 8000 through SO_REUSEPORT (default: 1)",
+    )
+    run_workers(parser.parse_args().workers)